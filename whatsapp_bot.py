@@ -4,22 +4,50 @@ Improved WhatsApp Web auto-reply bot (educational / experimental use).
 Replies once when the trigger text is seen, then exits.
 """
 
+import os
+import re
 import time
+import asyncio
+import json
 import logging
 import signal
+from collections import OrderedDict
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import SessionNotCreatedException, StaleElementReferenceException
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
 
 class WhatsAppBot:
-    def __init__(self, driver_path=None, headless=False, wait_timeout=600):
+    # CSS locators (matched by the browser's selector engine, unlike XPath class scans);
+    # update these when WhatsApp Web changes its markup
+    _SEL_READY = (By.CSS_SELECTOR, 'div[contenteditable="true"][data-tab]')
+    _SEL_SEARCH = (By.CSS_SELECTOR, 'div[contenteditable="true"][data-tab="3"]')
+    # the compose box lives in the chat footer; its data-tab value differs across versions
+    _SEL_INPUT = (By.CSS_SELECTOR, 'footer div[contenteditable="true"]')
+    _SEL_MSG = (By.CSS_SELECTOR, "div.message-in, div.message-out")
+    _INCOMING_CSS = "div.message-in"
+    _PANEL_CSS = "#main"  # the open conversation
+    # only the last N message containers are considered new, both when scanning and observing
+    _SCAN_WINDOW = 8
+    # only the last few containers are ever scanned, so a small id window is enough
+    _MAX_PROCESSED = 512
+    # media is not needed to read text messages; blocking it keeps WhatsApp's DOM and CPU use small
+    _BLOCKED_URLS = [
+        "*.jpg", "*.jpeg", "*.png", "*.webp", "*.mp4", "*.ogg",
+        "*/profile-pic*", "*/ttf*", "*.woff2",
+    ]
+
+    # a persistent profile keeps the WhatsApp session, so the QR code only has to be scanned once
+    DEFAULT_PROFILE_DIR = os.path.expanduser("~/.wa_bot_profile")
+
+    def __init__(self, driver_path=None, headless=False, wait_timeout=600, block_media=True,
+                 profile_dir=DEFAULT_PROFILE_DIR):
         logging.info("Setting up Chrome driver...")
         chrome_options = webdriver.ChromeOptions()
         if headless:
@@ -27,13 +55,77 @@ class WhatsAppBot:
             chrome_options.add_argument("--disable-gpu")
         chrome_options.add_argument("--no-sandbox")
         chrome_options.add_argument("--disable-dev-shm-usage")
-        # chrome_options.add_argument(r"--user-data-dir=./whatsapp_profile")  # persist session if desired
+        chrome_options.add_argument(f"--user-data-dir={profile_dir}")
+        if block_media:
+            chrome_options.add_experimental_option(
+                "prefs", {"profile.managed_default_content_settings.images": 2}
+            )
 
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=chrome_options)
-        self.wait = WebDriverWait(self.driver, wait_timeout)
+        # resolved chromedriver path is cached next to the profile
+        self._driver_cache_path = profile_dir.rstrip("/\\") + "_driver.json"
+        self.driver = self._launch_driver(chrome_options, driver_path)
+        # the long timeout only covers the one-time QR scan; everything else fails fast
+        self.long_wait = WebDriverWait(self.driver, wait_timeout)
+        self.wait = WebDriverWait(self.driver, 10, poll_frequency=0.2)
         self.running = True
-        self.processed = set()  # set of message ids already seen/handled
+        self.processed = OrderedDict()  # message ids already seen/handled, oldest first
+        # cached element handles, re-resolved when WhatsApp re-renders them
+        self._search_box = None
+        self._input_box = None
+        # container count and last container id seen by the previous scan
+        self._last_count = 0
+        self._last_id = None
+        if block_media:
+            self._block_media_requests()
+
+    def _launch_driver(self, chrome_options, driver_path=None):
+        if driver_path:
+            return webdriver.Chrome(service=Service(driver_path), options=chrome_options)
+
+        cache = self._load_driver_cache()
+        cached_path = cache.get("path")
+        if cached_path and os.path.exists(cached_path):
+            try:
+                driver = webdriver.Chrome(service=Service(cached_path), options=chrome_options)
+            except SessionNotCreatedException as e:
+                # anything else (e.g. the profile is already in use) would fail again
+                # with a fresh driver too
+                if "only supports Chrome version" not in str(e):
+                    raise
+                logging.info("Cached chromedriver does not match Chrome, reinstalling: %s", e)
+            else:
+                if cache.get("browser_major") != self._browser_major(driver):
+                    # Chrome was updated; install a matching driver on the next run
+                    self._save_driver_cache(None)
+                return driver
+
+        # imported here: webdriver_manager is only needed when no cached driver can be used
+        from webdriver_manager.chrome import ChromeDriverManager
+        path = ChromeDriverManager().install()
+        driver = webdriver.Chrome(service=Service(path), options=chrome_options)
+        self._save_driver_cache({"path": path, "browser_major": self._browser_major(driver)})
+        return driver
+
+    @staticmethod
+    def _browser_major(driver):
+        return str(driver.capabilities.get("browserVersion", "")).split(".")[0]
+
+    def _load_driver_cache(self):
+        try:
+            with open(self._driver_cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_driver_cache(self, cache):
+        try:
+            if cache is None:
+                os.remove(self._driver_cache_path)
+                return
+            with open(self._driver_cache_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+        except OSError as e:
+            logging.debug("Could not update driver cache: %s", e)
 
     def start(self):
         logging.info("Opening WhatsApp Web...")
@@ -41,11 +133,8 @@ class WhatsAppBot:
         logging.info("Please scan the QR code with your phone if necessary...")
         # Wait until main chat area or search box is available
         try:
-            self.wait.until(EC.presence_of_element_located(
-                (By.XPATH, '//div[@contenteditable="true" and @data-tab]')
-            ))
+            self.long_wait.until(EC.presence_of_element_located(self._SEL_READY))
             logging.info("WhatsApp Web ready.")
-            time.sleep(1)
         except Exception as e:
             logging.error("Timeout waiting for WhatsApp Web to be ready: %s", e)
             raise
@@ -53,136 +142,242 @@ class WhatsAppBot:
     def select_chat(self, chat_name, timeout=10):
         try:
             logging.info("Searching for chat: %s", chat_name)
-            search_box = self.wait.until(EC.element_to_be_clickable(
-                (By.XPATH, '//div[@contenteditable="true" and @data-tab="3"]')
-            ))
-            search_box.click()
-            time.sleep(0.2)
+            try:
+                search_box = self._get_search_box()
+                search_box.click()
+            except StaleElementReferenceException:
+                self._search_box = None
+                search_box = self._get_search_box()
+                search_box.click()
             search_box.clear()
             search_box.send_keys(chat_name)
             # wait and click the resulting title
-            title = WebDriverWait(self.driver, timeout).until(
+            title = WebDriverWait(self.driver, timeout, poll_frequency=0.2).until(
                 EC.element_to_be_clickable((By.XPATH, f'//span[@title="{chat_name}"]'))
             )
             title.click()
-            time.sleep(1)
+            # the chat is open once its footer input is rendered; keep it for send_message
+            self._input_box = WebDriverWait(self.driver, timeout, poll_frequency=0.2).until(
+                EC.presence_of_element_located(self._SEL_INPUT)
+            )
             logging.info("Selected chat: %s", chat_name)
             return True
         except Exception as e:
             logging.error("Could not select chat '%s': %s", chat_name, e)
             return False
 
-    def _get_last_message_containers(self, max_messages=10):
+    def _get_search_box(self):
+        if self._search_box is None:
+            self._search_box = self.wait.until(EC.element_to_be_clickable(self._SEL_SEARCH))
+        return self._search_box
+
+    def _get_input_box(self):
+        if self._input_box is None:
+            self._input_box = self.driver.find_element(*self._SEL_INPUT)
+        return self._input_box
+
+    # Returns {id, text} for a message container; shared by the scan and the observer.
+    _DESCRIBE_JS = """
+        function (n) {
+            const span = n.querySelector('span[dir="ltr"]');
+            const text = (span ? span.innerText : n.innerText).trim();
+            let id = n.getAttribute('data-id') || n.getAttribute('data-msg-id')
+                || n.getAttribute('data-pre-plain-text') || n.getAttribute('data-id-message');
+            if (!id) {
+                // fallback: text hash
+                const key = n.innerText.trim();
+                let h = 0;
+                for (let i = 0; i < key.length; i++) {
+                    h = (h * 31 + key.charCodeAt(i)) | 0;
+                }
+                id = 'fallback::' + h;
+            }
+            return {id: id, text: text};
+        }
+    """
+
+    # Collect id + text of the last N message containers in a single round-trip
+    # instead of several find_element/get_attribute calls per container.
+    # When neither the container count nor the last container's id changed since the
+    # previous scan (arguments[2], arguments[3]), nothing is described, so an idle poll
+    # costs one lookup. Any change (new message, chat switch, node recycling) describes
+    # the whole window; already handled ids are skipped by the caller.
+    _SCAN_JS = """
+        const describe = %s;
+        const nodes = document.querySelectorAll(arguments[0]);
+        const last = nodes.length ? describe(nodes[nodes.length - 1]) : null;
+        const lastId = last ? last.id : null;
+        if (nodes.length === arguments[2] && lastId === arguments[3]) {
+            return {count: nodes.length, lastId: lastId, messages: []};
+        }
+        const messages = Array.from(nodes).slice(-arguments[1], -1).map(describe);
+        if (last) messages.push(last);
+        return {count: nodes.length, lastId: lastId, messages: messages};
+    """ % _DESCRIBE_JS
+
+    # Long-polls for new incoming messages. A MutationObserver on the open conversation
+    # queues them in the page, and the call resolves on the first one or after
+    # arguments[0] ms, so Python waits on a single request instead of re-querying the DOM.
+    # The observer is (re)attached whenever the conversation panel changes. Only
+    # inserted nodes among the last N containers are queued, so history rendered when a
+    # chat is opened or scrolled back is ignored.
+    _WAIT_JS = """
+        const done = arguments[arguments.length - 1];
+        const describe = %(describe)s;
+        const st = window.__waBot || (window.__waBot = {queue: [], panel: null, observer: null, waiter: null});
+        const panel = document.querySelector('%(panel)s');
+        if (panel !== st.panel) {
+            if (st.observer) st.observer.disconnect();
+            st.panel = panel;
+            st.observer = null;
+            if (panel) {
+                st.observer = new MutationObserver(records => {
+                    const added = new Set();
+                    for (const rec of records) {
+                        for (const node of rec.addedNodes) {
+                            if (node.nodeType !== 1) continue;
+                            if (node.matches('%(incoming)s')) added.add(node);
+                            node.querySelectorAll('%(incoming)s').forEach(n => added.add(n));
+                        }
+                    }
+                    if (!added.size) return;
+                    const recent = Array.from(panel.querySelectorAll('%(messages)s')).slice(-%(window)d);
+                    for (const n of recent) {
+                        if (added.has(n)) st.queue.push(describe(n));
+                    }
+                    if (st.queue.length && st.waiter) st.waiter();
+                });
+                st.observer.observe(panel, {childList: true, subtree: true});
+            }
+        }
+        if (st.queue.length) {
+            done(st.queue.splice(0));
+            return;
+        }
+        let timer = null;
+        const flush = () => {
+            clearTimeout(timer);
+            st.waiter = null;
+            done(st.queue.splice(0));
+        };
+        st.waiter = flush;
+        timer = setTimeout(flush, arguments[0]);
+    """ % {
+        "describe": _DESCRIBE_JS, "panel": _PANEL_CSS, "incoming": _INCOMING_CSS,
+        "messages": _SEL_MSG[1], "window": _SCAN_WINDOW,
+    }
+
+    def _scan_messages_js(self, max_messages=10):
         try:
-            containers = self.driver.find_elements(
-                By.XPATH,
-                '//div[contains(@class,"message-in")] | //div[contains(@class,"message-out")]'
+            result = self.driver.execute_script(
+                self._SCAN_JS, self._SEL_MSG[1], max_messages, self._last_count, self._last_id
             )
-            return containers[-max_messages:] if len(containers) >= max_messages else containers
         except Exception as e:
-            logging.debug("Failed to get message containers: %s", e)
+            logging.debug("Failed to scan messages: %s", e)
             return []
+        self._last_count = result["count"]
+        self._last_id = result["lastId"]
+        return result["messages"]
 
-    def _extract_message_id(self, container):
-        # try several attributes then fallback to text+position hash
-        for attr in ("data-id", "data-msg-id", "data-pre-plain-text", "data-id-message"):
-            try:
-                val = container.get_attribute(attr)
-                if val:
-                    return val
-            except Exception:
-                pass
+    def _block_media_requests(self):
         try:
-            text = container.text.strip()
-            loc = container.location
-            size = container.size
-            return f"fallback::{hash((text, loc.get('x'), loc.get('y'), size.get('height'), size.get('width')))}"
-        except Exception:
-            return None
-
-    def _extract_text_from_container(self, container):
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self._BLOCKED_URLS})
+        except Exception as e:
+            logging.warning("Could not block media requests: %s", e)
+
+    def _wait_for_incoming(self, timeout):
         try:
-            # try to find the LTR span commonly used for message text
-            try:
-                span = container.find_element(By.XPATH, './/span[@dir="ltr"]')
-                return span.text.strip()
-            except Exception:
-                return container.text.strip()
+            return self.driver.execute_async_script(self._WAIT_JS, int(timeout * 1000)) or []
         except Exception as e:
-            logging.debug("Failed to extract text: %s", e)
-            return ""
+            logging.debug("Waiting for new messages failed: %s", e)
+            time.sleep(timeout)
+            return []
+
+    async def _wait_for_messages(self, timeout):
+        """
+        Return the messages that arrived within timeout seconds.
+        The in-page observer ends the wait early; the delta scan always runs as a safety net.
+        """
+        messages = await asyncio.to_thread(self._wait_for_incoming, timeout)
+        messages.extend(await asyncio.to_thread(self._scan_messages_js, self._SCAN_WINDOW))
+        return messages
+
+    def _mark_processed(self, mid):
+        self.processed[mid] = None
+        if len(self.processed) > self._MAX_PROCESSED:
+            self.processed.popitem(last=False)
 
     def send_message(self, message):
         try:
-            # Find message input; different data-tab values exist across WhatsApp versions
-            message_box = self.driver.find_element(
-                By.XPATH,
-                '//div[@contenteditable="true" and (@data-tab="10" or @data-tab="6" or @data-tab="1")]'
-            )
-            message_box.click()
-            message_box.send_keys(message)
-            message_box.send_keys(Keys.ENTER)
+            try:
+                message_box = self._get_input_box()
+                message_box.click()
+            except StaleElementReferenceException:
+                self._input_box = None
+                message_box = self._get_input_box()
+                message_box.click()
+            message_box.send_keys(message + Keys.ENTER)
             logging.info("Sent message: %s", message)
             return True
         except Exception as e:
             logging.error("Error sending message: %s", e)
             return False
 
-    def monitor_messages(self, trigger_text, reply_text, group_name=None, poll_interval=2):
+    async def monitor_messages(self, trigger_text, reply_text, group_name=None, poll_interval=2):
         """
         Monitor visible messages and auto-reply once when trigger_text is found, then exit.
+        Blocking Selenium calls run in a worker thread; cancel the task to stop monitoring.
         """
-        trigger_lower = trigger_text.lower()
+        trigger_pattern = re.compile(re.escape(trigger_text), re.IGNORECASE)
 
         if group_name:
-            if not self.select_chat(group_name):
+            if not await asyncio.to_thread(self.select_chat, group_name):
                 logging.warning("Falling back to currently open chat.")
 
         logging.info("Monitoring for trigger: %r", trigger_text)
         logging.info("Bot will reply once and exit when trigger is detected.")
 
-        # graceful shutdown handler
-        def _signal_handler(sig, frame):
-            logging.info("Received shutdown signal. Stopping...")
-            self.running = False
-
-        signal.signal(signal.SIGINT, _signal_handler)
-        signal.signal(signal.SIGTERM, _signal_handler)
+        # the long-poll script times out after poll_interval; leave room for the round-trip
+        await asyncio.to_thread(self.driver.set_script_timeout, poll_interval + 10)
+        self._last_count = 0
+        self._last_id = None
+        messages = await asyncio.to_thread(self._scan_messages_js, self._SCAN_WINDOW)
 
         while self.running:
             try:
-                containers = self._get_last_message_containers(max_messages=8)
-                for c in containers:
-                    mid = self._extract_message_id(c)
+                for msg in messages:
+                    mid = msg.get("id")
                     if not mid:
                         continue
                     if mid in self.processed:
                         continue
 
-                    text = self._extract_text_from_container(c)
+                    text = msg.get("text") or ""
                     if not text:
-                        self.processed.add(mid)
+                        self._mark_processed(mid)
                         continue
 
-                    if trigger_lower in text.lower():
+                    if trigger_pattern.search(text):
                         logging.info("Trigger matched in message id=%s: %s", mid, text)
-                        sent = self.send_message(reply_text)
+                        sent = await asyncio.to_thread(self.send_message, reply_text)
                         if sent:
-                            self.processed.add(mid)
+                            self._mark_processed(mid)
                             logging.info("Reply sent successfully. Exiting bot...")
-                            time.sleep(1)  # brief pause to ensure message is sent
+                            await asyncio.sleep(1)  # brief pause to ensure message is sent
                             self.running = False  # stop the loop
                             return True  # indicate success
                         else:
                             logging.warning("Failed to send reply for message id=%s", mid)
-                            self.processed.add(mid)
+                            self._mark_processed(mid)
                     else:
-                        self.processed.add(mid)
+                        self._mark_processed(mid)
 
-                time.sleep(poll_interval)
+                messages = await self._wait_for_messages(poll_interval)
             except Exception as e:
                 logging.exception("Exception in monitor loop: %s", e)
-                time.sleep(2)
+                await asyncio.sleep(2)
+                messages = []
         
         return False  # didn't find trigger or was interrupted
 
@@ -194,6 +389,16 @@ class WhatsAppBot:
             logging.debug("Error closing driver: %s", e)
 
 
+async def run_until_terminated(coro):
+    """Await coro, cancelling it when the process receives SIGTERM."""
+    task = asyncio.ensure_future(coro)
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    except NotImplementedError:  # not supported by the Windows event loop
+        pass
+    return await task
+
+
 if __name__ == "__main__":
     # --- Configuration ---
     TRIGGER_MESSAGE = "Kimler çalışabilir?"
@@ -204,13 +409,17 @@ if __name__ == "__main__":
     try:
         bot.start()
         logging.info("Bot active. Open the group/chat you want to monitor in WhatsApp Web.")
-        success = bot.monitor_messages(TRIGGER_MESSAGE, AUTO_REPLY, group_name=GROUP_NAME, poll_interval=2)
+        success = asyncio.run(run_until_terminated(
+            bot.monitor_messages(TRIGGER_MESSAGE, AUTO_REPLY, group_name=GROUP_NAME, poll_interval=2)
+        ))
         if success:
             logging.info("Mission accomplished! Bot replied and is now exiting.")
         else:
             logging.info("Bot stopped without finding trigger message.")
     except KeyboardInterrupt:
         logging.info("Interrupted by user.")
+    except asyncio.CancelledError:
+        logging.info("Received shutdown signal. Stopping...")
     except Exception as e:
         logging.exception("Fatal error: %s", e)
     finally: